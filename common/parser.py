@@ -220,7 +220,7 @@ def thread(res: bytes) -> ParsedThread | ParserError:
             developer = developer.split(separator)[0]
         while True:
             prev_developer = developer
-            developer = re.sub(r"(" + r"|".join(developer_remove_patterns) + r")", r"", developer, flags=re.IGNORECASE)
+            developer = developer_remove_re.sub(r"", developer)
             if not developer:
                 developer = prev_developer
                 break
@@ -488,3 +488,5 @@ developer_remove_patterns = [
     r" enty",
     r"https?://\S*",
 ]
+
+developer_remove_re = re.compile(r"(" + r"|".join(developer_remove_patterns) + r")", re.IGNORECASE)
@@ -37,6 +37,9 @@ redis: aredis.Redis = None
 locks_lock = asyncio.Lock()
 locks: dict[asyncio.Lock] = {}
 version: str = None
+# Thread ids known to exist in the keyspace, None until the first full scan by
+# watch_versions(), lets the watchers skip lookups for never-cached threads
+tracked_ids: set[str] = None
 
 LAST_CACHED = "LAST_CACHED"
 CACHED_WITH = "CACHED_WITH"
@@ -48,7 +51,8 @@ NAME_FORMAT = "thread:{id}"
 @contextlib.asynccontextmanager
 async def lifespan(_version: str):
     global redis, version
-    redis = aredis.Redis(decode_responses=True)
+    # RESP3 + hiredis parse the big watcher pipeline replies in C
+    redis = aredis.Redis(decode_responses=True, protocol=3)
     await redis.ping()
     version = _version
 
@@ -127,6 +131,7 @@ async def _update_thread_cache(id: int, name: str) -> None:
         result = f95zone.ERROR_INTERNAL_ERROR
     old_fields = await redis.hgetall(name)
     now = time.time()
+    write_cache = redis.pipeline()
 
     if isinstance(result, f95zone.IndexerError):
         # Something went wrong, keep cache and retry sooner/later
@@ -136,7 +141,8 @@ async def _update_thread_cache(id: int, name: str) -> None:
         }
         if result is f95zone.ERROR_THREAD_MISSING:
             # F95zone responded but thread is missing, remove any previous cache
-            await redis.delete(name)
+            # (UNLINK so Redis reclaims a large hash off the main thread)
+            write_cache.unlink(name)
             if last_change := old_fields.get(LAST_CHANGE):
                 new_fields[LAST_CHANGE] = last_change
         # Consider new error as a change
@@ -164,4 +170,7 @@ async def _update_thread_cache(id: int, name: str) -> None:
     new_fields[CACHED_WITH] = version
     if LAST_CHANGE not in old_fields and LAST_CHANGE not in new_fields:
         new_fields[LAST_CHANGE] = int(now)
-    await redis.hmset(name, new_fields)
+    write_cache.hmset(name, new_fields)
+    await write_cache.execute()
+    if tracked_ids is not None:
+        tracked_ids.add(str(id))
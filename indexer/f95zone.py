@@ -70,6 +70,14 @@ ERROR_INTERNAL_ERROR = IndexerError(
 async def lifespan(version: str):
     global session, cookies
     session = aiohttp.ClientSession(
+        # Keep warm connections around so concurrent watcher requests
+        # don't each pay a fresh TCP+TLS handshake
+        connector=aiohttp.TCPConnector(
+            limit=32,
+            limit_per_host=16,
+            keepalive_timeout=75,
+            ttl_dns_cache=300,
+        ),
         cookie_jar=aiohttp.DummyCookieJar(),
         timeout=TIMEOUT,
         headers={
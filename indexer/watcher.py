@@ -1,8 +1,12 @@
 import asyncio
 import contextlib
 import datetime as dt
-import json
 import logging
+import random
+import time
+
+import aiohttp
+import orjson
 
 from external import error
 from indexer import (
@@ -18,69 +22,135 @@ WATCH_UPDATES_CATEGORIES = (
 )
 WATCH_VERSIONS_INTERVAL = dt.timedelta(hours=12).total_seconds()
 WATCH_VERSIONS_CHUNK_SIZE = 1000
+WATCH_VERSIONS_CONCURRENCY = 8
+# Heartbeat key, timestamp of the last completed updates poll
+LAST_WATCH = "LAST_WATCH"
+WATCH_BACKOFF_MAX = dt.timedelta(hours=1).total_seconds()
+WATCH_BACKOFF_JITTER = dt.timedelta(seconds=30).total_seconds()
+
+# Formatted once here so the hot loops only do plain concatenation / lookups
+NAME_PREFIX = cache.NAME_FORMAT.split("{")[0]
+LATEST_CATEGORY_URLS = {
+    category: f95zone.LATEST_URL.format(t="list", c=category, p=1)
+    for category in WATCH_UPDATES_CATEGORIES
+}
 
 logger = logging.getLogger(__name__)
+# Conditional request state per category, filled in from response headers
+last_etag: dict[str, str] = {}
+last_modified: dict[str, str] = {}
 
 
 @contextlib.asynccontextmanager
 async def lifespan():
-    updates_task = asyncio.create_task(watch_updates())
-    versions_task = asyncio.create_task(watch_versions())
+    # Skip the event loop hop for tasks that can complete synchronously (Python 3.12+)
+    if hasattr(asyncio, "eager_task_factory"):
+        asyncio.get_running_loop().set_task_factory(asyncio.eager_task_factory)
 
-    try:
-        yield
-    finally:
+    # TaskGroup cancels the sibling watcher if one somehow dies
+    async with asyncio.TaskGroup() as watchers:
+        updates_task = watchers.create_task(watch_updates())
+        versions_task = watchers.create_task(watch_versions())
 
-        updates_task.cancel()
-        versions_task.cancel()
+        try:
+            yield
+        finally:
 
+            updates_task.cancel()
+            versions_task.cancel()
 
-# https://stackoverflow.com/a/312464
-def chunks(lst, n):
-    for i in range(0, len(lst), n):
-        yield lst[i : i + n]
 
+async def f95zone_get_bytes(
+    url: str,
+    cookies: dict | None = None,
+    headers: dict | None = None,
+) -> tuple[aiohttp.ClientResponse, bytes]:
+    async with f95zone.session.get(url, cookies=cookies, headers=headers) as req:
+        return req, await req.read()
 
-async def watch_updates():
-    while True:
-        try:
-            logger.debug("Poll updates start")
 
-            invalidate_cache = cache.redis.pipeline()
+async def poll_category(
+    category: str,
+) -> tuple[list[tuple[str, str, str | None]], tuple[str, str] | None]:
+    logger.debug(f"Poll category {category}")
+
+    cached_versions = cache.redis.pipeline()
+
+    headers = {}
+    if etag := last_etag.get(category):
+        headers["If-None-Match"] = etag
+    if modified := last_modified.get(category):
+        headers["If-Modified-Since"] = modified
+
+    req, res = await f95zone_get_bytes(
+        LATEST_CATEGORY_URLS[category],
+        cookies=f95zone.cookies,
+        headers=headers,
+    )
 
-            for category in WATCH_UPDATES_CATEGORIES:
-                logger.debug(f"Poll category {category}")
+    if req.status == 304:
+        # Nothing changed since last poll, skip downloading and parsing
+        logger.debug(f"Category {category} not modified")
+        return [], None
 
-                cached_versions = cache.redis.pipeline()
+    if index_error := f95zone.check_error(res):
+        raise Exception(index_error.error_flag)
 
-                async with f95zone.session.get(
-                    f95zone.LATEST_URL.format(t="list", c=category, p=1),
-                    cookies=f95zone.cookies,
-                ) as req:
-                    res = await req.read()
+    try:
+        updates = orjson.loads(res)
+    except Exception:
+        raise Exception(f"Latest updates returned invalid JSON: {res}")
+    if updates["status"] != "ok":
+        raise Exception(f"Latest updates returned an error: {updates}")
+
+    # Returned to the caller, only remembered once the invalidations are applied
+    validators = (req.headers.get("ETag"), req.headers.get("Last-Modified"))
+
+    names = []
+    versions = []
+    for update in updates["msg"]["data"]:
+        id = str(update["thread_id"])
+        if cache.tracked_ids is not None and id not in cache.tracked_ids:
+            continue  # Not cached, the HGET would just return None
+        name = NAME_PREFIX + id
+        names.append(name)
+        cached_versions.hget(name, "version")
+        versions.append(update["version"])
 
-                if index_error := f95zone.check_error(res):
-                    raise Exception(index_error.error_flag)
+    cached_versions = await cached_versions.execute()
 
-                try:
-                    updates = json.loads(res)
-                except Exception:
-                    raise Exception(f"Latest updates returned invalid JSON: {res}")
-                if updates["status"] != "ok":
-                    raise Exception(f"Latest updates returned an error: {updates}")
+    assert len(names) == len(versions) == len(cached_versions)
+    return list(zip(names, versions, cached_versions)), validators
 
-                names = []
-                versions = []
-                for update in updates["msg"]["data"]:
-                    name = cache.NAME_FORMAT.format(id=update["thread_id"])
-                    names.append(name)
-                    cached_versions.hget(name, "version")
-                    versions.append(update["version"])
 
-                cached_versions = await cached_versions.execute()
+def backoff(interval: float, failures: int) -> float:
+    # Exponential backoff with jitter, capped so outages keep being retried
+    sleep_for = min(interval * 2**failures, WATCH_BACKOFF_MAX)
+    return sleep_for + random.uniform(0, WATCH_BACKOFF_JITTER)
 
-                assert len(names) == len(versions) == len(cached_versions)
-                for name, version, cached_version in zip(names, versions, cached_versions):
+
+async def watch_updates():
+    failures = 0
+    while True:
+        try:
+            logger.debug("Poll updates start")
+            poll_started = time.time()
+
+            # Categories are independent requests, poll them all at once
+            results = await asyncio.gather(
+                *(poll_category(category) for category in WATCH_UPDATES_CATEGORIES),
+                return_exceptions=True,
+            )
+
+            invalidate_cache = cache.redis.pipeline()
+            validators = {}
+            for category, result in zip(WATCH_UPDATES_CATEGORIES, results):
+                if isinstance(result, BaseException):
+                    raise result
+                result, category_validators = result
+                if category_validators is not None:
+                    validators[category] = category_validators
+                for name, version, cached_version in result:
                     if cached_version is None:
                         continue
                     if not version or version == "Unknown":
@@ -94,87 +164,130 @@ async def watch_updates():
                             f" ({cached_version!r} -> {version!r})"
                         )
 
-            if len(invalidate_cache):
-                result = await invalidate_cache.execute()
-                invalidated = sum(ret != "0" for ret in result)
+            # Advance the watermark in the same round trip as the invalidations
+            invalidate_cache.set(LAST_WATCH, int(poll_started))
+            result = await invalidate_cache.execute()
+            invalidated = sum(map(bool, result[:-1]))
+            if invalidated:
                 logger.info(f"Updates: Invalidated cache for {invalidated} threads")
 
+            # Only remember validators once their poll's invalidations are applied,
+            # a failed poll must retry in full instead of being skipped by 304s
+            for category, (etag, modified) in validators.items():
+                if etag:
+                    last_etag[category] = etag
+                if modified:
+                    last_modified[category] = modified
+
             logger.debug("Poll updates done")
+            failures = 0
+            sleep_for = WATCH_UPDATES_INTERVAL
 
         except Exception:
             logger.error(f"Error polling updates: {error.text()}\n{error.traceback()}")
+            failures += 1
+            sleep_for = backoff(WATCH_UPDATES_INTERVAL, failures)
 
-        await asyncio.sleep(WATCH_UPDATES_INTERVAL)
+        await asyncio.sleep(sleep_for)
 
 
 async def watch_versions():
+    semaphore = asyncio.Semaphore(WATCH_VERSIONS_CONCURRENCY)
+
+    async def process_chunk(names_chunk: list[str]) -> list[tuple[str, str, str]]:
+        async with semaphore:
+            cached_versions = cache.redis.pipeline()
+            ids = []
+            for name in names_chunk:
+                cached_versions.hget(name, "version")
+                ids.append(name.split(":", 1)[1])
+            csv = ",".join(ids)
+
+            # Await together for efficiency
+            (_, res), cached_versions = await asyncio.gather(
+                f95zone_get_bytes(f95zone.VERCHK_URL.format(threads=csv)),
+                cached_versions.execute(),
+            )
+
+            if index_error := f95zone.check_error(res):
+                raise Exception(index_error.error_flag)
+
+            try:
+                versions = orjson.loads(res)
+            except Exception:
+                raise Exception(f"Versions API returned invalid JSON: {res}")
+            if (
+                versions["status"] == "error"
+                and versions["msg"] == "Thread not found"
+            ):
+                return []
+            elif versions["status"] != "ok":
+                raise Exception(f"Versions API returned an error: {versions}")
+            versions = versions["msg"]
+
+            assert len(names_chunk) == len(ids) == len(cached_versions)
+            mismatched = []
+            for name, id, cached_version in zip(names_chunk, ids, cached_versions):
+                if cached_version is None:
+                    continue
+                version = versions.get(id)
+                if not version or version == "Unknown":
+                    continue
+
+                if version != cached_version:
+                    mismatched.append((name, version, cached_version))
+            return mismatched
+
+    failures = 0
+    sleep_for = WATCH_VERSIONS_INTERVAL
     while True:
-        await asyncio.sleep(WATCH_VERSIONS_INTERVAL)
+        await asyncio.sleep(sleep_for)
 
         try:
             logger.debug("Poll versions start")
 
-            names = [n async for n in cache.redis.scan_iter("thread:*", 10000, "hash")]
-            invalidate_cache = cache.redis.pipeline()
+            # Chunks are independent requests, dispatch each as soon as the scan
+            # fills it (bounded by semaphore) instead of materializing every name
+            tasks = []
+            names_chunk = []
+            seen_ids = set()
+            async for name in cache.redis.scan_iter("thread:*", 10000, "hash"):
+                seen_ids.add(name.split(":", 1)[1])
+                names_chunk.append(name)
+                if len(names_chunk) == WATCH_VERSIONS_CHUNK_SIZE:
+                    tasks.append(asyncio.create_task(process_chunk(names_chunk)))
+                    names_chunk = []
+            if names_chunk:
+                tasks.append(asyncio.create_task(process_chunk(names_chunk)))
+
+            # Merge instead of replace: threads cached mid-scan register into the
+            # old set and may be behind the cursor, and ids never leave the keyspace
+            cache.tracked_ids = seen_ids | (cache.tracked_ids or set())
+
+            chunk_results = await asyncio.gather(*tasks, return_exceptions=True)
 
-            for names_chunk in chunks(names, WATCH_VERSIONS_CHUNK_SIZE):
-
-                cached_versions = cache.redis.pipeline()
-                csv = ""
-                ids = []
-                for name in names_chunk:
-                    cached_versions.hget(name, "version")
-                    id = name.split(":")[1]
-                    csv += f"{id},"
-                    ids.append(id)
-                csv = csv.strip(",")
-
-                async with f95zone.session.get(
-                    f95zone.VERCHK_URL.format(threads=csv),
-                ) as req:
-                    # Await together for efficiency
-                    res, cached_versions = await asyncio.gather(
-                        req.read(), cached_versions.execute()
+            invalidate_cache = cache.redis.pipeline()
+            for result in chunk_results:
+                if isinstance(result, BaseException):
+                    raise result
+                for name, version, cached_version in result:
+                    # Delete version too to avoid ending up here again
+                    invalidate_cache.hdel(name, cache.LAST_CACHED, "version")
+                    logger.warning(
+                        f"Versions: Invalidating cache for {name}"
+                        f" ({cached_version!r} -> {version!r})"
                     )
 
-                if index_error := f95zone.check_error(res):
-                    raise Exception(index_error.error_flag)
-
-                try:
-                    versions = json.loads(res)
-                except Exception:
-                    raise Exception(f"Versions API returned invalid JSON: {res}")
-                if (
-                    versions["status"] == "error"
-                    and versions["msg"] == "Thread not found"
-                ):
-                    continue
-                elif versions["status"] != "ok":
-                    raise Exception(f"Versions API returned an error: {versions}")
-                versions = versions["msg"]
-
-                assert len(names_chunk) == len(ids) == len(cached_versions)
-                for name, id, cached_version in zip(names_chunk, ids, cached_versions):
-                    if cached_version is None:
-                        continue
-                    version = versions.get(id)
-                    if not version or version == "Unknown":
-                        continue
-
-                    if version != cached_version:
-                        # Delete version too to avoid ending up here again
-                        invalidate_cache.hdel(name, cache.LAST_CACHED, "version")
-                        logger.warning(
-                            f"Versions: Invalidating cache for {name}"
-                            f" ({cached_version!r} -> {version!r})"
-                        )
-
             if len(invalidate_cache):
                 result = await invalidate_cache.execute()
-                invalidated = sum(ret != "0" for ret in result)
+                invalidated = sum(map(bool, result))
                 logger.warning(f"Versions: Invalidated cache for {invalidated} threads")
 
             logger.debug("Poll versions done")
+            failures = 0
+            sleep_for = WATCH_VERSIONS_INTERVAL
 
         except Exception:
             logger.error(f"Error polling versions: {error.text()}\n{error.traceback()}")
+            failures += 1
+            sleep_for = backoff(WATCH_VERSIONS_INTERVAL, failures)